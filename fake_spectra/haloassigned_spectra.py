@@ -1,6 +1,7 @@
 """This module contains a class and functions which do analysis on spectra associated to
 galactic halos. This is fundamentally a somewhat wooly idea, because absorbers and halos are not always closely associated!"""
 from __future__ import print_function
+import itertools
 import numpy as np
 try:
     import numexpr as ne
@@ -13,11 +14,6 @@ from . import subfindhdf
 from . import spec_utils
 from . import plot_spectra as ps
 
-try:
-    xrange(1)
-except NameError:
-    xrange = range
-
 class HaloAssignedSpectra(ps.PlottingSpectra):
     """Class which extends the Spectra class to include methods that connect each absorber in a sightline to a galactic halo."""
     def __init__(self, *args, **kwargs):
@@ -40,9 +36,11 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
         #nlos = np.shape(vel_width)[0]
         #print('nlos = ',nlos)
         virial = self.virial_vel(halos[f_ind])
-        m_table = 10**np.arange(np.log10(np.min(virial)+0.1), np.log10(np.max(virial)), dm)
-        mbin = np.array([(m_table[i]+m_table[i+1])/2. for i in range(0,np.size(m_table)-1)])
-        pdf = np.histogram(np.log10(virial),np.log10(m_table), density=True)[0]
+        lvirial = np.log10(virial)
+        l_table = np.arange(np.log10(np.min(virial)+0.1), np.max(lvirial), dm)
+        m_table = 10**l_table
+        mbin = (m_table[1:]+m_table[:-1])/2.
+        pdf = spec_utils.uniform_hist_edges(lvirial, l_table, density=True)
         print("Field DLAs: ",np.size(halos)-np.size(f_ind))
         return (mbin, pdf)
 
@@ -114,7 +112,7 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
         dists = []
         halos = []
         #X axis first
-        for ii in xrange(len(zpos)):
+        for ii in range(len(zpos)):
             proj_pos = np.array(self.cofm[ii,:])
             ax = self.axis[ii]-1
             dists.append([])
@@ -147,8 +145,11 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
         contig = []
         seps = np.zeros(self.NumLos, dtype=np.bool)
         (roll, colden) = spec_utils.get_rolled_spectra(den)
+        #Pixel indices and the size of a pixel in kpc/h, which are the same for every region.
+        pixels = np.arange(self.nbins)
+        pix_to_box = 1.*self.box/self.nbins
         #deal with periodicity by making sure the deepest point is in the middle
-        for ii in xrange(self.NumLos):
+        for ii in range(self.NumLos):
             # This is column density, not absorption, so we cannot
             # use the line width to find the peak region.
             lcolden = colden[ii,:]
@@ -159,31 +160,39 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
                 seps = combine_regions(lcolden > relthresh*np.max(lcolden))
             # Find weighted z position for each one
             zposes = []
-            for jj in xrange(np.shape(seps)[0]):
-                nn = np.arange(self.nbins)[seps[jj,0]:seps[jj,1]]-roll[ii]
+            for jj in range(np.shape(seps)[0]):
+                nn = pixels[seps[jj,0]:seps[jj,1]]-roll[ii]
                 llcolden = lcolden[seps[jj,0]:seps[jj,1]]
                 zpos = np.sum(llcolden*nn)
                 summ = np.sum(llcolden)
                 #Make sure it refers to a valid position
                 zpos = (zpos / summ) % self.nbins
-                zpos *= 1.*self.box/self.nbins
+                zpos *= pix_to_box
                 zposes.append(zpos)
             contig.append(zposes)
         return contig
 
     def find_nearest_halo(self):
         """Find the single most massive halos associated with absorption near a sightline, possibly via a subhalo."""
-        (halos, subhalos) = self.find_nearby_halos()
+        try:
+            return (self.spectra_nearest_halo, 0)
+        except AttributeError:
+            pass
+        ((halo_ptr, halo_flat), (sub_ptr, sub_flat)) = self.find_nearby_halos_flat()
+        #Virial velocities of all halos, so we do not recompute them for each sightline.
+        all_vir_vel = self.virial_vel()
+        #Padded arrays of candidate halos for each sightline: -1 marks an empty slot.
+        #Duplicates do not matter as we only want the largest.
+        subhalo_parent = pad_flat(sub_ptr, self.sub_sub_index[sub_flat])
+        both = np.hstack([subhalo_parent, pad_flat(halo_ptr, halo_flat)])
         outhalos = np.zeros(self.NumLos,dtype=int)-1
-        for ii in xrange(self.NumLos):
-            subhalo_parent = list(self.sub_sub_index[subhalos[ii]])
-            both = list(set(subhalo_parent+halos[ii]))
-            if len(both) > 0:
-                vir_vel = self.virial_vel(both)
-                ind = np.where(vir_vel == np.max(vir_vel))
-                outhalos[ii] = both[ind[0][0]]
-            else:
-                outhalos[ii] = -1
+        if np.shape(both)[1] > 0:
+            #Virial velocities are non-negative, so empty slots are only chosen
+            #if the sightline has no halos, in which case the result is -1.
+            vir_vel = np.where(both >= 0, all_vir_vel[both], -1)
+            ind = np.argmax(vir_vel, axis=1)
+            outhalos = both[np.arange(self.NumLos), ind]
+        self.spectra_nearest_halo = outhalos
         return (outhalos, 0)
 
     def find_nearby_halos(self):
@@ -196,7 +205,7 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
         (halos, _) = self.assign_to_halo(zpos, self.sub_radii, self.sub_cofm)
         (subhalos, _) = self.assign_to_halo(zpos, self.sub_sub_radii, self.sub_sub_cofm)
         #Merge absorption features inside the same halo
-        for ii in xrange(self.NumLos):
+        for ii in range(self.NumLos):
             halos[ii] = list(set(halos[ii]))
             subhalos[ii] = list(set(subhalos[ii]))
         print("no. halos: ",sum([len(hh) for hh in halos])," mult halos: ",sum([len(hh) > 1 for hh in halos]))
@@ -205,6 +214,17 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
         self.spectra_subhalos = subhalos
         return (halos, subhalos)
 
+    def find_nearby_halos_flat(self):
+        """As find_nearby_halos, but with each list of lists stored as a pair of flat arrays,
+        (indptr, flat), so that the halos near sightline ii are flat[indptr[ii]:indptr[ii+1]]."""
+        try:
+            return self.spectra_halos_flat
+        except AttributeError:
+            pass
+        (halos, subhalos) = self.find_nearby_halos()
+        self.spectra_halos_flat = (flatten_lists(halos), flatten_lists(subhalos))
+        return self.spectra_halos_flat
+
     def get_stellar_mass_function(self):
         """Plot the galaxy stellar mass function for a snapshot."""
         subs=subfindhdf.SubFindHDF5(self.base, self.num)
@@ -219,32 +239,44 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
         gsmf = gsmf/volume/dlogM
         return (sm, gsmf)
 
-    def _plot_breakdown(self, array, filt, low, high, labels, dv, log=True):
+    def _plot_breakdown(self, array, filt, low, high, labels, dv, log=True, ax=None):
         """
-        Helper function to plot something broken down by halo mass
+        Helper function to plot something broken down by halo mass.
+        ax - axes to plot on. If None, the current axes.
         """
         #Find virial velocity
         (halo, _) = self.find_nearest_halo()
-        ind = np.where(halo[filt] > 0)
-        virial = self.virial_vel(halo[filt][ind])
-        array = array[filt]
-        #Make bins
+        #Boolean masks for the filtered spectra, and those of them with a halo
+        mask = np.zeros(np.size(halo), dtype=bool)
+        mask[filt] = True
+        hmask = np.logical_and(mask, halo > 0)
+        virial = self.virial_vel(halo[hmask])
+        inhalo = hmask[mask]
+        array = array[mask]
+        if ax is None:
+            ax = plt.gca()
+        #Make bins, which are uniform in x_table.
         if log:
-            func = plt.semilogx
-            v_table = 10**np.arange(np.min(np.log10(array)),np.max(np.log10(array)) , dv)
+            func = ax.semilogx
+            xx = np.log10(array)
+            x_table = np.arange(np.min(xx),np.max(xx) , dv)
+            v_table = 10**x_table
         else:
-            func = plt.plot
-            v_table = np.arange(np.min(array),np.max(array) , dv)
-        vbin = np.array([(v_table[i]+v_table[i+1])/2. for i in range(0,np.size(v_table)-1)])
+            func = ax.plot
+            xx = array
+            x_table = np.arange(np.min(xx),np.max(xx) , dv)
+            v_table = x_table
+        vbin = (v_table[1:]+v_table[:-1])/2.
         #Histogram of vel width
-        vhist = np.histogram(array, v_table)[0]
+        vhist = spec_utils.uniform_hist_edges(xx, x_table)
         vhist[np.where(vhist == 0)] = 1
+        xx_halo = xx[inhalo]
         colors = ("red", "purple", "cyan")
         lss = ("--", ":", "-")
         #Histogram of vel width for all halos in given virial velocity bin
-        for ii in xrange(len(low)):
-            vind = np.where((virial > low[ii])*(virial < high[ii]))
-            vhist2 = np.histogram(array[ind][vind], v_table)[0]
+        for ii in range(len(low)):
+            vind = np.logical_and(virial > low[ii], virial < high[ii])
+            vhist2 = spec_utils.uniform_hist_edges(xx_halo[vind], x_table)
             func(vbin, vhist2/(1.*vhist), color=colors[ii], ls=lss[ii], label=labels[ii])
 #         vind = np.where(halo[filt] < 0)
 #         vhist2 = np.histogram(array[vind], v_table)[0]
@@ -253,26 +285,41 @@ class HaloAssignedSpectra(ps.PlottingSpectra):
     def plot_Z_vs_mass(self,color="blue", color2="darkblue"):
         """Plot the correlation between mass and metallicity, with a fit"""
         (halo, _) = self.find_nearest_halo()
-        ind = np.where(halo > 0)
-        met = self.get_metallicity()[ind]
-        mind = np.where(met > 1e-4)
-        halo = halo[ind]
-        mass = self.sub_mass[halo]
-        mass = mass[mind]
-        met = met[mind]
+        met = self.get_metallicity()
+        mask = np.logical_and(halo > 0, met > 1e-4)
+        mass = self.sub_mass[halo[mask]]
+        met = met[mask]
         self._plot_2d_contour(mass+0.1, met, 10, "Z mass", color, color2)
         plt.ylim(1e-4,1)
 
     def _plot_xx_vs_mass(self, xx, name = "xx", color="blue", color2="darkblue", log=True):
         """Helper function to plot something against virial velocity"""
         (halo, _) = self.find_nearest_halo()
-        ind = np.where(halo > 0)
-        halo = halo[ind]
-        xx = xx[ind]
-        virial = self.virial_vel(halo)+0.1
+        mask = halo > 0
+        xx = xx[mask]
+        virial = self.virial_vel(halo[mask])+0.1
         self._plot_2d_contour(virial, xx, 10, name+" virial velocity", color, color2, ylog=log)
 
 
+def flatten_lists(lists):
+    """Convert a list of lists of integers into a pair of arrays (indptr, flat),
+    such that lists[ii] == flat[indptr[ii]:indptr[ii+1]]."""
+    lens = np.array([len(ll) for ll in lists], dtype=int)
+    indptr = np.concatenate([[0], np.cumsum(lens)]).astype(int)
+    flat = np.fromiter(itertools.chain.from_iterable(lists), dtype=int, count=indptr[-1])
+    return (indptr, flat)
+
+def pad_flat(indptr, flat, fill=-1):
+    """Pack the rows of a flattened list of lists (see flatten_lists) into a 2D array,
+    one row per list. Rows shorter than the longest list are padded with fill."""
+    lens = np.diff(indptr)
+    width = np.max(lens) if np.size(lens) > 0 else 0
+    padded = np.zeros((np.size(lens), width), dtype=int)+fill
+    rows = np.repeat(np.arange(np.size(lens)), lens)
+    cols = np.arange(np.size(flat)) - np.repeat(indptr[:-1], lens)
+    padded[rows, cols] = flat
+    return padded
+
 def combine_regions(condition, mindist=0):
     """Combine contiguous regions that are shorter than mindist"""
     reg = contiguous_regions(condition)
@@ -280,7 +327,7 @@ def combine_regions(condition, mindist=0):
     if mindist > 0 and np.shape(reg)[0] > 1:
         newreg = np.array(reg[0,:])
         newreg.shape = (1,2)
-        for ii in xrange(1,np.shape(reg)[0]):
+        for ii in range(1,np.shape(reg)[0]):
             if reg[ii,0] - newreg[-1,1] < mindist:
                 #Move the end point of the last segment to that of this one
                 newreg[-1,1] = reg[ii,1]
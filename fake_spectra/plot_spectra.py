@@ -5,13 +5,10 @@ from __future__ import print_function
 import numpy as np
 #import leastsq as lsq
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 
 from . import spectra
-
-try:
-    xrange(1)
-except NameError:
-    xrange = range
+from . import spec_utils
 
 class PlottingSpectra(spectra.Spectra):
     """Class to plot things connected with spectra."""
@@ -39,7 +36,7 @@ class PlottingSpectra(spectra.Spectra):
         """
         tau = self.get_tau(elem, ion, line, spec_num)
         peak = np.where(tau == np.max(tau))[0][0]
-        szt = int(np.size(tau)/2)
+        szt = np.size(tau)//2
         tau_l = np.roll(tau, szt - peak+int(offset*self.dvbin))
         xaxis = (np.arange(0,np.size(tau))-szt)*self.dvbin
         self.plot_spectrum_raw(tau_l,xaxis, xlims, flux, color=color,ls=ls)
@@ -68,18 +65,19 @@ class PlottingSpectra(spectra.Spectra):
     def plot_density(self, elem, ion, num, thresh=1e-9, color="blue"):
         """Plot the density of an ion along a sightline"""
         den = self.get_density(elem, ion)
-        mcol = np.max(den[num])
-        ind_m = np.where(den[num] == mcol)[0][0]
-        den = np.roll(den[num], int(np.size(den[num])/2) - ind_m)
+        ind_m = int(np.argmax(den[num]))
+        den = np.roll(den[num], den[num].size//2 - ind_m)
         phys = self.dvbin/self.velfac
+        #Position of the peak, which is now in the central pixel
+        centre = (np.size(den)//2)*phys
         #Add one to avoid zeros on the log plot
-        plt.semilogy(np.arange(0,np.size(den))*phys-np.size(den)/2*phys,den+1e-30, color=color)
+        plt.semilogy(np.arange(0,np.size(den))*phys-centre,den+1e-30, color=color)
         plt.xlabel(r"x (kpc h$^{-1}$)")
         plt.ylabel(r"n (cm$^{-3}$)")
         #Set limits
         ind = np.where(den > thresh)
         if np.size(ind) > 0:
-            dxlim = np.max(np.abs((ind[0][0]*phys-np.size(den)/2*phys-50, ind[0][-1]*phys-np.size(den)/2*phys+50)))
+            dxlim = np.max(np.abs((ind[0][0]*phys-centre-50, ind[0][-1]*phys-centre+50)))
             plt.xlim(-1.*dxlim,dxlim)
         else:
             dxlim = np.size(den)*phys
@@ -93,26 +91,26 @@ class PlottingSpectra(spectra.Spectra):
             thresh - density threshold above with to track the pixels
             xlim - width of shown plot in km/s
             voff - constant value to shift the high x axis by."""
-        #Number of points to draw for each line
-        npix = 10
         #Get densities above threshold
         den = self.get_density(elem, ion)[num]
-        imax = np.where(den == np.max(den))[0][0]
+        imax = int(np.argmax(den))
         ind = np.where(den > thresh)
         #Get peculiar velocity along sightline
         ax = self.axis[num]-1
         vel = self.get_velocity(elem, ion)[num, :, ax]
         #Adjust the axis offset.
         vel -= vel[imax]-voff
-        #Convert pixel coordinates to offsets from peak
+        #Convert pixel coordinates to offsets from peak,
+        #wrapping periodically so they lie within half a box of it.
         ind = np.ravel(ind)
-        coord = (ind - imax)*self.dvbin
-        coord[np.where(coord > self.nbins/2)] = coord - self.nbins
-        coord[np.where(coord < -self.nbins/2)] = coord + self.nbins
-        for (cc, ii) in zip(coord, ind):
-            x = np.linspace(cc/xscale,cc+vel[ii], npix)
-            y = np.linspace(0,1,npix)
-            plt.plot(x,y,ls="-", color="black")
+        half = self.nbins//2
+        coord = ((ind - imax + half) % self.nbins - half)*self.dvbin
+        #Draw all the (straight) lines at once
+        segments = np.zeros((np.size(ind), 2, 2))
+        segments[:, 0, 0] = coord/xscale
+        segments[:, 1, 0] = coord+vel[ind]
+        segments[:, 1, 1] = 1
+        plt.gca().add_collection(LineCollection(segments, colors="black", linestyles="-"))
         plt.xlabel(r"v (km s$^{-1}$)")
         plt.xlim(-1.*xlim, xlim)
         plt.ylim(0,1)
@@ -124,34 +122,40 @@ class PlottingSpectra(spectra.Spectra):
         den = self.get_density(elem, ion)
         ind = np.where(den < 1e-6)
         den[ind] = 0.
-        temps = np.sum(temp*den, axis=1)/np.sum(den, axis=1)
+        den_sum = np.sum(den, axis=1)
+        temps = np.sum(temp*den, axis=1)/den_sum
         ind2 = np.where(temps < 1e5)
         print(np.median(temps)," filt: ", np.median(temps[ind2]))
-        self._plot_2d_contour(np.sum(den,axis=1)[ind2], temps[ind2], 40, name="Temp Density", color="blue", color2="darkblue", ylog=False, xlog=True, fit=False, sample = 300)
+        self._plot_2d_contour(den_sum[ind2], temps[ind2], 40, name="Temp Density", color="blue", color2="darkblue", ylog=False, xlog=True, fit=False, sample = 300)
         plt.xlabel(r"n (cm$^{-3}$)")
         plt.ylabel(r"T (K)")
         plt.ylim(0,2e4)
 
-    def plot_cddf(self,elem = "H", ion = 1, dlogN=0.2, minN=13, maxN=23., color="blue", moment=False, dX=True):
-        """Plots the column density distribution function. """
+    def plot_cddf(self,elem = "H", ion = 1, dlogN=0.2, minN=13, maxN=23., color="blue", moment=False, dX=True, ax=None):
+        """Plots the column density distribution function.
+        ax - axes to plot on. If None, the current axes."""
         (NHI,f_N)=self.column_density_function(elem, ion, dlogN,minN-1,maxN+1,dX=dX)
         if moment:
             f_N *= NHI
-        plt.loglog(NHI,f_N,color=color, label=self.label)
-        ax=plt.gca()
+        if ax is None:
+            ax = plt.gca()
+        ax.loglog(NHI,f_N,color=color, label=self.label)
         ax.set_xlabel(r"$N (\mathrm{cm}^{-2})$")
         ax.set_ylabel(r"$f(N) (\mathrm{cm}^2)$")
-        plt.xlim(10**minN, 10**maxN)
+        ax.set_xlim(10**minN, 10**maxN)
 #         if moment:
 #             plt.ylim(1e-4,1)
 
-    def _plot_metallicity(self, met, nbins=20,color="blue", ls="-"):
-        """Plot the distribution of metallicities"""
+    def _plot_metallicity(self, met, nbins=20,color="blue", ls="-", ax=None):
+        """Plot the distribution of metallicities.
+        ax - axes to plot on. If None, the current axes."""
         bins=np.linspace(-3,0,nbins)
-        mbin = np.array([(bins[i]+bins[i+1])/2. for i in range(0,np.size(bins)-1)])
+        mbin = (bins[1:]+bins[:-1])/2.
         #Abs. distance for entire spectrum
         hist = np.histogram(np.log10(met),bins,density=True)[0]
-        plt.plot(mbin,hist,color=color,label=self.label,ls=ls)
+        if ax is None:
+            ax = plt.gca()
+        ax.plot(mbin,hist,color=color,label=self.label,ls=ls)
 
     def plot_metallicity(self, nbins=20,color="blue", ls="-", width=0.):
         """Plot the distribution of metallicities"""
@@ -167,11 +171,12 @@ class PlottingSpectra(spectra.Spectra):
         """Plot the difference between the single-species ionisation and the metallicity from GFM_Metallicity"""
         met = np.log10(self.get_metallicity())
         ion_met = np.log10(self.get_ion_metallicity(species, ion))
-        diff = 10**(ion_met - met)
-        print(np.max(diff), np.min(diff), np.median(diff))
+        #Ratio of the two metallicities, in log space.
+        ldiff = ion_met - met
+        print(10**np.max(ldiff), 10**np.min(ldiff), 10**np.median(ldiff))
         bins=np.linspace(-1,1,nbins)
-        mbin = np.array([(bins[i]+bins[i+1])/2. for i in range(0,np.size(bins)-1)])
-        hist = np.histogram(np.log10(diff),bins,density=True)[0]
+        mbin = (bins[1:]+bins[:-1])/2.
+        hist = spec_utils.uniform_hist(ldiff, bins[0], bins[-1], nbins-1, density=True)
         plt.plot(mbin,hist,color=color,label=self.label,ls=ls)
 
     def plot_eq_width_vs_col_den(self, elem, ion, line):
@@ -182,24 +187,26 @@ class PlottingSpectra(spectra.Spectra):
         plt.xlabel(r"W $(\AA)$")
         plt.ylabel(r"N$_\mathrm{HI}$ (cm$^{2}$)")
 
-    def _plot_2d_contour(self, xvals, yvals, nbins, name="x y", color="blue", color2="darkblue", ylog=True, xlog=True, fit=False, sample=40.):
-        """Helper function to make a 2D contour map of a correlation, as well as the best-fit linear fit"""
+    def _plot_2d_contour(self, xvals, yvals, nbins, name="x y", color="blue", color2="darkblue", ylog=True, xlog=True, fit=False, sample=40., ax=None):
+        """Helper function to make a 2D contour map of a correlation, as well as the best-fit linear fit.
+        ax - axes to plot on. If None, the current axes."""
         if ylog:
             yvals = np.log10(yvals)
         if xlog:
             xvals = np.log10(xvals)
-        (H, xedges, yedges) = np.histogram2d(xvals, yvals,bins=nbins)
-        xbins=np.array([(xedges[i+1]+xedges[i])/2 for i in xrange(0,np.size(xedges)-1)])
-        ybins=np.array([(yedges[i+1]+yedges[i])/2 for i in xrange(0,np.size(yedges)-1)])
+        (H, xedges, yedges) = spec_utils.histogram2d(xvals, yvals, nbins)
+        xbins=(xedges[1:]+xedges[:-1])/2.
+        ybins=(yedges[1:]+yedges[:-1])/2.
         xx = np.logspace(np.min(xbins), np.max(xbins),15)
-        ax = plt.gca()
+        if ax is None:
+            ax = plt.gca()
         if ylog:
             ybins = 10**ybins
             ax.set_yscale('log')
         if xlog:
             xbins = 10**xbins
             ax.set_xscale('log')
-        plt.contourf(xbins,ybins,H.T,(self.NumLos/sample)*np.array([0.15,1,10]),colors=(color,color2,"black"),alpha=0.5)
+        ax.contourf(xbins,ybins,H.T,(self.NumLos/sample)*np.array([0.15,1,10]),colors=(color,color2,"black"),alpha=0.5)
         #if fit:
         #    (intercept, slope, _) = lsq.leastsq(xvals,yvals)
         #    plt.loglog(xx, 10**intercept*xx**slope, color="black",label=self.label, ls="--")
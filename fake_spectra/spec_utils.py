@@ -1,6 +1,11 @@
 """Some utility functions for the spectra."""
 import numpy as np
 from scipy.ndimage.filters import gaussian_filter1d
+try:
+    import fast_histogram
+except ImportError:
+    #Non-essential
+    pass
 
 def res_corr(flux, dvbin, fwhm=8):
     """
@@ -41,3 +46,63 @@ def _roll_one_spectra(tau_l):
     tau_out = np.roll(tau_l, int(np.size(tau_l)/2)- ind_m)
     roll = int(np.size(tau_l)/2) - ind_m
     return roll, tau_out
+
+def uniform_hist(x, lo, hi, nbins, density=False):
+    """
+    Histogram x into nbins equal-width bins spanning [lo, hi].
+    Equivalent to np.histogram(x, np.linspace(lo, hi, nbins+1), density=density)[0], but
+    the bin index is computed directly rather than searched for,
+    which is much faster for large arrays.
+    Values outside [lo, hi] are discarded; hi is included in the last bin.
+    """
+    #No bins (only one edge): np.histogram returns an empty histogram
+    if nbins <= 0 or hi <= lo:
+        return np.zeros(max(nbins, 0), dtype=np.intp)
+    x = np.ravel(x)
+    inrange = np.logical_and(x >= lo, x <= hi)
+    idx = ((x[inrange] - lo) * (nbins / (hi - lo))).astype(np.intp)
+    #The upper edge belongs to the last bin
+    idx[np.where(idx >= nbins)] = nbins - 1
+    hist = np.bincount(idx, minlength=nbins)
+    if density:
+        return hist / (np.sum(hist) * (hi - lo) / (1.*nbins))
+    return hist
+
+def uniform_hist_edges(x, edges, density=False):
+    """
+    As uniform_hist, but taking an array of equally spaced bin edges,
+    like np.histogram(x, edges, density=density)[0].
+    With fewer than two edges there are no bins, and the histogram is empty.
+    """
+    if np.size(edges) < 2:
+        return np.zeros(0, dtype=np.intp)
+    return uniform_hist(x, edges[0], edges[-1], np.size(edges)-1, density=density)
+
+def histogram2d(xvals, yvals, nbins):
+    """
+    Equivalent to np.histogram2d(xvals, yvals, bins=nbins), with nbins equal-width bins
+    between the extrema of each array. Uses the fast_histogram module if it is available,
+    in which case points lying exactly on an inner bin edge may be counted in the
+    neighbouring bin, because of rounding.
+    Returns (H, xedges, yedges).
+    """
+    if np.size(xvals) == 0:
+        return np.histogram2d(xvals, yvals, bins=nbins)
+    (xmin, xmax) = (np.min(xvals), np.max(xvals))
+    (ymin, ymax) = (np.min(yvals), np.max(yvals))
+    #Widen an empty range as np.histogram2d does
+    if xmin == xmax:
+        xmin -= 0.5
+        xmax += 0.5
+    if ymin == ymax:
+        ymin -= 0.5
+        ymax += 0.5
+    hist_range = [[xmin, xmax], [ymin, ymax]]
+    try:
+        H = fast_histogram.histogram2d(xvals, yvals, range=hist_range, bins=nbins)
+    except NameError:
+        return np.histogram2d(xvals, yvals, bins=nbins)
+    #fast_histogram excludes points on the upper edges, which np.histogram2d puts in the last bin.
+    edge = np.logical_or(xvals == xmax, yvals == ymax)
+    H += np.histogram2d(xvals[edge], yvals[edge], range=hist_range, bins=nbins)[0]
+    return (H, np.linspace(xmin, xmax, nbins+1), np.linspace(ymin, ymax, nbins+1))
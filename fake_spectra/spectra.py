@@ -338,7 +338,7 @@ class Spectra:
         flux : an array of spectra (flux)  we want to add noise to
         spec_num : the index to spectra we want to add nose to. Leave it as -1 to add the noise to all spectra.
         """
-        noise_array = np.array([])
+        noise_array = []
         if np.size(np.shape(flux)) == 1:
             lines = 1
         else:
@@ -352,8 +352,12 @@ class Spectra:
             for ii in xrange(lines):
                 np.random.seed(ii)
                 noise = np.random.normal(0, 1./snr[ii], self.nbins)
-                noise_array = np.append(noise_array, noise)
+                noise_array.append(noise)
                 flux[ii]+= noise
+        if len(noise_array) > 0:
+            noise_array = np.concatenate(noise_array)
+        else:
+            noise_array = np.array([])
         return (flux, noise_array)
 
 
@@ -456,27 +460,31 @@ class Spectra:
         """Read arrays and perform interpolation for a single file"""
         (pos, vel, elem_den, temp, hh, amumass) = self._read_particle_data(nsegment, elem, ion, get_tau)
         if load_all_data_first:
+            #Collect the segments and concatenate once at the end,
+            #rather than copying the growing arrays for every segment.
+            #Segments which contained no particles are skipped.
+            segments = []
+            if amumass is not False:
+                segments.append((pos, vel, elem_den, temp, hh))
             for nseg in range(1, self.snapshot_set.get_n_segments()):
                 (pos_, vel_, elem_den_, temp_, hh_, amumass_) = self._read_particle_data(nseg, elem, ion, get_tau)
                 if amumass_ is False:
                     continue
-                # We cannot concatenate onto empty arrays,
-                #so if the first segment contained no particles we must rename
-                if amumass is False:
-                    pos = pos_
-                    vel = vel_
-                    temp = temp_
-                    elem_den = elem_den_
-                    hh = hh_
-                else:
-                    pos = np.concatenate((pos, pos_), axis=0)
-                    if get_tau:
-                        vel = np.concatenate((vel, vel_), axis=0)
-                    elem_den = np.append(elem_den, elem_den_)
-                    if get_tau or (ion != -1 and elem != 'H'):
-                        temp = np.append(temp, temp_)
-                    hh = np.append(hh, hh_)
+                segments.append((pos_, vel_, elem_den_, temp_, hh_))
                 amumass = amumass_
+            if len(segments) > 0:
+                (pos, vel, elem_den, temp, hh) = zip(*segments)
+                pos = np.concatenate(pos, axis=0)
+                if get_tau:
+                    vel = np.concatenate(vel, axis=0)
+                else:
+                    vel = vel[0]
+                elem_den = np.concatenate([np.ravel(ed) for ed in elem_den])
+                if get_tau or (ion != -1 and elem != 'H'):
+                    temp = np.concatenate([np.ravel(tt) for tt in temp])
+                else:
+                    temp = temp[0]
+                hh = np.concatenate([np.ravel(h) for h in hh])
         if amumass is False:
             return np.zeros([np.shape(self.cofm)[0], self.nbins], dtype=np.float32)
         if get_tau:
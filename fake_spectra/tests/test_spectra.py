@@ -80,6 +80,7 @@ def eq_width_hist(self, elem, ion, line, dv=0.05, eq_cut = 0.02):
 """
 
 import numpy as np
+import pytest
 
 from fake_spectra import spectra as ss
 from fake_spectra import unitsystem
@@ -129,6 +130,102 @@ def testrescorr():
     for i in (0,1):
         assert np.size(np.where(tau2[i,:]> 0)) == 15
 
+def testUniformHist():
+    """Check the uniform bin histogram matches np.histogram"""
+    xx = np.log10(np.arange(1, 2000)/7.)
+    bins = np.arange(np.min(xx), np.max(xx), 0.1)
+    hist = spec_utils.uniform_hist(xx, bins[0], bins[-1], np.size(bins)-1)
+    assert np.all(hist == np.histogram(xx, bins)[0])
+    hist = spec_utils.uniform_hist(xx, -1, 1, 19)
+    assert np.all(hist == np.histogram(xx, np.linspace(-1, 1, 20))[0])
+    hist = spec_utils.uniform_hist(xx, -1, 1, 19, density=True)
+    assert np.all(np.abs(hist - np.histogram(xx, np.linspace(-1, 1, 20), density=True)[0]) < 1e-12)
+    #A single edge gives no bins
+    hist = spec_utils.uniform_hist(xx, xx[0], xx[0], 0)
+    assert np.shape(hist) == (0,)
+    assert np.all(hist == np.histogram(xx, [xx[0]])[0])
+    #Edge arrays with fewer than two edges, as from np.arange over a constant array
+    for edges in (np.array([]), np.array([xx[0]])):
+        hist = spec_utils.uniform_hist_edges(xx, edges)
+        assert np.shape(hist) == (0,)
+        assert np.all(hist == np.histogram(xx, edges)[0])
+    hist = spec_utils.uniform_hist_edges(xx, bins, density=True)
+    assert np.all(np.abs(hist - np.histogram(xx, bins, density=True)[0]) < 1e-12)
+
+def testHistogram2d():
+    """Check the fast_histogram 2D histogram matches np.histogram2d"""
+    pytest.importorskip("fast_histogram")
+    xx = np.log10(np.arange(1, 2000)/7.)
+    yy = np.sin(np.arange(1, 2000)/3.)
+    #The last case has a constant array, which np.histogram2d widens by 0.5 on each side.
+    for (xvals, yvals) in ((xx, yy), (yy, xx), (xx, np.ones_like(xx))):
+        (H, xedges, yedges) = spec_utils.histogram2d(xvals, yvals, 10)
+        (H2, xedges2, yedges2) = np.histogram2d(xvals, yvals, bins=10)
+        assert np.all(H == H2)
+        assert np.all(np.abs(xedges - xedges2) < 1e-12)
+        assert np.all(np.abs(yedges - yedges2) < 1e-12)
+    #Empty input
+    (H, xedges, yedges) = spec_utils.histogram2d(np.array([]), np.array([]), 10)
+    assert np.sum(H) == 0
+    assert np.shape(H) == (10, 10)
+
+def _haloassigned():
+    """Import the haloassigned_spectra module, which needs matplotlib."""
+    pytest.importorskip("matplotlib")
+    from fake_spectra import haloassigned_spectra
+    return haloassigned_spectra
+
+def testMassHistOneHalo():
+    """Check the host halo mass histogram is empty, not an error, when every DLA is in the same halo"""
+    hs = _haloassigned()
+    spec = hs.HaloAssignedSpectra.__new__(hs.HaloAssignedSpectra)
+    spec.find_nearest_halo = lambda: (np.array([2, 2, -1]), 0)
+    spec.virial_vel = lambda halos=None, subhalo=False: 100.*np.ones(np.size(halos))
+    (mbin, pdf) = spec.mass_hist()
+    assert np.size(mbin) == 0
+    assert np.size(pdf) == 0
+
+def testFlattenLists():
+    """Check we can flatten a list of lists and pad it back into a 2D array"""
+    hs = _haloassigned()
+    lists = [[1,2],[],[3]]
+    (indptr, flat) = hs.flatten_lists(lists)
+    assert np.all(indptr == np.array([0,2,2,3]))
+    for ii in range(len(lists)):
+        assert np.all(flat[indptr[ii]:indptr[ii+1]] == np.array(lists[ii]))
+    padded = hs.pad_flat(indptr, flat)
+    assert np.all(padded == np.array([[1,2],[-1,-1],[3,-1]]))
+    #All rows empty
+    (indptr, flat) = hs.flatten_lists([[],[]])
+    assert np.all(indptr == np.array([0,0,0]))
+    assert np.size(flat) == 0
+    assert np.shape(hs.pad_flat(indptr, flat)) == (2,0)
+    #No rows
+    (indptr, flat) = hs.flatten_lists([])
+    assert np.all(indptr == np.array([0]))
+    assert np.size(flat) == 0
+    assert np.shape(hs.pad_flat(indptr, flat)) == (0,0)
+
+def testFindNearestHalo():
+    """Check we pick the nearby halo or subhalo parent with the largest virial velocity"""
+    hs = _haloassigned()
+    spec = hs.HaloAssignedSpectra.__new__(hs.HaloAssignedSpectra)
+    spec.NumLos = 4
+    #Virial velocities of halos 0-3
+    vir_vel = np.array([10., 50., 30., 0.])
+    spec.virial_vel = lambda halos=None, subhalo=False: vir_vel
+    #Parent halos of subhalos 0-2
+    spec.sub_sub_index = np.array([1, 2, 3])
+    halos = [[0, 2], [], [], [3]]
+    subhalos = [[0], [], [1], []]
+    spec.find_nearby_halos = lambda: (halos, subhalos)
+    (outhalos, _) = spec.find_nearest_halo()
+    #0: the parent of subhalo 0 beats both halos
+    #1: nothing nearby
+    #2: only a subhalo, so its parent
+    #3: a halo with zero virial velocity is still chosen
+    assert np.all(outhalos == np.array([1, -1, 2, 3]))
+
 # def testNan():
 #     """Test nan"""
 #     spec = ss.Spectra(3,'/home/spb/data/Cosmo/Cosmo0_V6/L25n512/output', cofm=np.array([[ 10724.84151495,   4444.02494373,  10534.57817268]]), axis=np.array([1,]), savefile="testfile.hdf5", reload_file=True)